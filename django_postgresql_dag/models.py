@@ -5,8 +5,10 @@ The graph traversal queries use Postgresql's recursive CTEs to fetch an entire t
 query. These queries also topologically sort the ids by generation.
 """
 
+from collections import defaultdict, deque
 from copy import deepcopy
 from django.db import models
+from django.db.models import Exists, OuterRef
 from django.core.exceptions import ValidationError
 
 from .exceptions import NodeNotReachableException
@@ -21,6 +23,14 @@ from .query_builders import (
 
 
 class NodeManager(models.Manager):
+    def _edge_exists(self, field_name):
+        """
+        Returns an Exists expression matching edges whose field_name ("parent" or "child") is the outer node. Negated,
+        it lets PostgreSQL plan an anti-join rather than a LEFT OUTER JOIN filtered on NULL.
+        """
+        edge_model = self.model.children.through
+        return Exists(edge_model.objects.filter(**{field_name: OuterRef("pk")}))
+
     def roots(self, node=None):
         """
         Returns a Queryset of all root nodes (nodes with no parents) in the Node model. If a node instance is specified,
@@ -28,7 +38,7 @@ class NodeManager(models.Manager):
         """
         if node is not None:
             return node.roots()
-        return self.filter(parents__isnull=True)
+        return self.filter(~self._edge_exists("child"))
 
     def leaves(self, node=None):
         """
@@ -37,7 +47,29 @@ class NodeManager(models.Manager):
         """
         if node is not None:
             return node.leaves()
-        return self.filter(children__isnull=True)
+        return self.filter(~self._edge_exists("parent"))
+
+    def classify(self):
+        """
+        Returns a dictionary of {pk: classification} for all nodes in the Node model, where the classification is one
+        of "root", "leaf", "island", or "internal". All nodes are classified using a single query.
+        """
+        rows = self.annotate(
+            has_parents=self._edge_exists("child"),
+            has_children=self._edge_exists("parent"),
+        ).values_list("pk", "has_parents", "has_children")
+
+        classification = {}
+        for pk, has_parents, has_children in rows:
+            if has_parents and has_children:
+                classification[pk] = "internal"
+            elif has_children:
+                classification[pk] = "root"
+            elif has_parents:
+                classification[pk] = "leaf"
+            else:
+                classification[pk] = "island"
+        return classification
 
 
 def node_factory(edge_model, children_null=True, base_model=models.Model):
@@ -83,14 +115,18 @@ def node_factory(edge_model, children_null=True, base_model=models.Model):
             return _ordered_filter(self.__class__.objects, "pk", pks)
 
         def add_child(self, child, **kwargs):
-            """Provided with a Node instance, attaches that instance as a child to the current Node instance"""
+            """
+            Provided with a Node instance, attaches that instance as a child to the current Node instance. Returns the
+            newly created Edge instance.
+            """
             kwargs.update({"parent": self, "child": child})
 
             disable_circular_check = kwargs.pop("disable_circular_check", False)
             allow_duplicate_edges = kwargs.pop("allow_duplicate_edges", True)
 
             cls = self.children.through(**kwargs)
-            return cls.save(disable_circular_check=disable_circular_check, allow_duplicate_edges=allow_duplicate_edges)
+            cls.save(disable_circular_check=disable_circular_check, allow_duplicate_edges=allow_duplicate_edges)
+            return cls
 
         def remove_child(self, child=None, delete_node=False):
             """
@@ -116,7 +152,10 @@ def node_factory(edge_model, children_null=True, base_model=models.Model):
                         child.delete()
 
         def add_parent(self, parent, *args, **kwargs):
-            """Provided with a Node instance, attaches the current instance as a child to the provided Node instance"""
+            """
+            Provided with a Node instance, attaches the current instance as a child to the provided Node instance.
+            Returns the newly created Edge instance.
+            """
             return parent.add_child(self, **kwargs)
 
         def remove_parent(self, parent=None, delete_node=False):
@@ -148,7 +187,7 @@ def node_factory(edge_model, children_null=True, base_model=models.Model):
 
         def ancestors(self, **kwargs):
             """Returns a QuerySet of all nodes in connected paths in a rootward direction"""
-            pks = [item.pk for item in self.ancestors_raw(**kwargs)]
+            pks = [item.pk for item in self.ancestors_raw(**kwargs).iterator()]
             return self.ordered_queryset_from_pks(pks)
 
         def ancestors_count(self):
@@ -157,12 +196,12 @@ def node_factory(edge_model, children_null=True, base_model=models.Model):
 
         def self_and_ancestors(self, **kwargs):
             """Returns a QuerySet of all nodes in connected paths in a rootward direction, prepending with self"""
-            pks = [self.pk] + [item.pk for item in self.ancestors_raw(**kwargs)][::-1]
+            pks = [self.pk] + [item.pk for item in self.ancestors_raw(**kwargs).iterator()][::-1]
             return self.ordered_queryset_from_pks(pks)
 
         def ancestors_and_self(self, **kwargs):
             """Returns a QuerySet of all nodes in connected paths in a rootward direction, appending with self"""
-            pks = [item.pk for item in self.ancestors_raw(**kwargs)] + [self.pk]
+            pks = [item.pk for item in self.ancestors_raw(**kwargs).iterator()] + [self.pk]
             return self.ordered_queryset_from_pks(pks)
 
         def descendants_raw(self, **kwargs):
@@ -171,7 +210,7 @@ def node_factory(edge_model, children_null=True, base_model=models.Model):
 
         def descendants(self, **kwargs):
             """Returns a QuerySet of all nodes in connected paths in a leafward direction"""
-            pks = [item.pk for item in self.descendants_raw(**kwargs)]
+            pks = [item.pk for item in self.descendants_raw(**kwargs).iterator()]
             return self.ordered_queryset_from_pks(pks)
 
         def descendants_count(self):
@@ -180,12 +219,12 @@ def node_factory(edge_model, children_null=True, base_model=models.Model):
 
         def self_and_descendants(self, **kwargs):
             """Returns a QuerySet of all nodes in connected paths in a leafward direction, prepending with self"""
-            pks = [self.pk] + [item.pk for item in self.descendants_raw(**kwargs)]
+            pks = [self.pk] + [item.pk for item in self.descendants_raw(**kwargs).iterator()]
             return self.ordered_queryset_from_pks(pks)
 
         def descendants_and_self(self, **kwargs):
             """Returns a QuerySet of all nodes in connected paths in a leafward direction, appending with self"""
-            pks = [item.pk for item in self.descendants_raw(**kwargs)] + [self.pk]
+            pks = [item.pk for item in self.descendants_raw(**kwargs).iterator()] + [self.pk]
             return self.ordered_queryset_from_pks(pks)
 
         def clan(self, **kwargs):
@@ -193,9 +232,9 @@ def node_factory(edge_model, children_null=True, base_model=models.Model):
             Returns a QuerySet with all ancestors nodes, self, and all descendant nodes
             """
             pks = (
-                [item.pk for item in self.ancestors_raw(**kwargs)]
+                [item.pk for item in self.ancestors_raw(**kwargs).iterator()]
                 + [self.pk]
-                + [item.pk for item in self.descendants_raw(**kwargs)]
+                + [item.pk for item in self.descendants_raw(**kwargs).iterator()]
             )
             return self.ordered_queryset_from_pks(pks)
 
@@ -273,7 +312,8 @@ def node_factory(edge_model, children_null=True, base_model=models.Model):
             if self is ending_node:
                 return 0
             else:
-                return self.path(ending_node, **kwargs).count() - 1
+                # Count the path's nodes directly, rather than building an ordered QuerySet of them just to count it
+                return len(list(self.path_raw(ending_node, **kwargs))) - 1
 
         def is_root(self):
             """
@@ -338,32 +378,47 @@ def node_factory(edge_model, children_null=True, base_model=models.Model):
 
         def connected_graph(self, **kwargs):
             """Returns a QuerySet of all nodes connected in any way to the current Node instance"""
-            pks = [item.pk for item in self.connected_graph_raw(**kwargs)]
+            pks = [item.pk for item in self.connected_graph_raw(**kwargs).iterator()]
             return self.ordered_queryset_from_pks(pks)
 
         def connected_graph_node_count(self, **kwargs):
             """Returns the number of nodes in the graph connected in any way to the current Node instance"""
             return len(list(self.connected_graph_raw()))
 
+        def _tree(self, from_field, to_field):
+            """
+            Fetches edges one generation at a time, selecting the related nodes in the same query, then builds the
+            nested tree in Python. Issues one query per generation rather than one per node.
+            """
+            related = defaultdict(list)
+            seen = {self.pk}
+            frontier = {self.pk}
+            while frontier:
+                edges = edge_model.objects.filter(**{f"{from_field}_id__in": frontier}).select_related(to_field)
+                frontier = set()
+                for edge in edges:
+                    node = getattr(edge, to_field)
+                    related[getattr(edge, f"{from_field}_id")].append(node)
+                    if node.pk not in seen:
+                        seen.add(node.pk)
+                        frontier.add(node.pk)
+
+            def subtree(pk):
+                return {node: subtree(node.pk) for node in related[pk]}
+
+            return subtree(self.pk)
+
         def descendants_tree(self):
             """
             Returns a tree-like structure with descendants for the current Node
             """
-            # ToDo: Modify to use CTE
-            tree = {}
-            for child in self.children.all():
-                tree[child] = child.descendants_tree()
-            return tree
+            return self._tree("parent", "child")
 
         def ancestors_tree(self):
             """
             Returns a tree-like structure with ancestors for the current Node
             """
-            # ToDo: Modify to use CTE
-            tree = {}
-            for parent in self.parents.all():
-                tree[parent] = parent.ancestors_tree()
-            return tree
+            return self._tree("child", "parent")
 
         def _roots(self, ancestors_tree):
             """
@@ -441,12 +496,13 @@ def node_factory(edge_model, children_null=True, base_model=models.Model):
 
         @staticmethod
         def circular_checker(parent, child):
-            if child in parent.self_and_ancestors():
+            # Check against the pks from a single ancestors CTE rather than building and hydrating an ordered QuerySet
+            if child.pk == parent.pk or child.pk in AncestorQuery(instance=parent).id_list():
                 raise ValidationError("The object is an ancestor.")
 
         @staticmethod
         def duplicate_edge_checker(parent, child):
-            if child in parent.self_and_descendants():
+            if child.pk == parent.pk or child.pk in DescendantQuery(instance=parent).id_list():
                 raise ValidationError("The edge is a duplicate.")
 
     return Node
@@ -458,7 +514,13 @@ class EdgeManager(models.Manager):
         Provided a QuerySet of nodes, returns a QuerySet of all Edge instances where a parent and child Node are within
         the QuerySet of nodes
         """
-        return _ordered_filter(self.model.objects, ["parent", "child"], nodes_queryset)
+        # Resolve the node pks once, rather than evaluating nodes_queryset for the ordering and again as subqueries.
+        # RawQuerySets and plain iterables of nodes have no values_list, so their pks are read from the instances.
+        if isinstance(nodes_queryset, models.QuerySet):
+            pks = list(nodes_queryset.values_list("pk", flat=True))
+        else:
+            pks = [node.pk for node in nodes_queryset]
+        return _ordered_filter(self.model.objects, ["parent", "child"], pks)
 
     def descendants(self, node, **kwargs):
         """
@@ -495,8 +557,23 @@ class EdgeManager(models.Manager):
         """
         Given a list or set of Edge instances, sort them from root-side to leaf-side
         """
-        # ToDo: Implement
-        pass
+        # Kahn's algorithm over the parent/child ids, so no related Node instances are fetched
+        edges_by_parent = defaultdict(list)
+        indegree = defaultdict(int)
+        for edge in edges:
+            edges_by_parent[edge.parent_id].append(edge)
+            indegree[edge.child_id] += 1
+
+        frontier = deque(node_id for node_id in edges_by_parent if indegree[node_id] == 0)
+        sorted_edges = []
+        while frontier:
+            node_id = frontier.popleft()
+            for edge in edges_by_parent.get(node_id, []):
+                sorted_edges.append(edge)
+                indegree[edge.child_id] -= 1
+                if indegree[edge.child_id] == 0:
+                    frontier.append(edge.child_id)
+        return sorted_edges
 
     def insert_node(self, edge, node, clone_to_rootside=False, clone_to_leafside=False, pre_save=None, post_save=None):
         """
@@ -544,9 +621,7 @@ class EdgeManager(models.Manager):
         n3 = NetworkNode.objects.create(name="n3")
 
         # Connect n3 to n1
-        n1.add_child(n3)
-
-        e1 = NetworkEdge.objects.last()
+        e1 = n1.add_child(n3)
 
         # function to clear the `name` field, which is autogenerated and must be unique
         def pre_save(new_edge):
@@ -576,7 +651,7 @@ class EdgeManager(models.Manager):
                 rootside_edge = post_save(rootside_edge)
 
         else:
-            edge.parent.add_child(node)
+            rootside_edge = edge.parent.add_child(node)
 
         # Attach the leaf-side edge
         if clone_to_leafside:
@@ -594,7 +669,7 @@ class EdgeManager(models.Manager):
                 leafside_edge = post_save(leafside_edge)
 
         else:
-            edge.child.add_parent(node)
+            leafside_edge = edge.child.add_parent(node)
 
         # Remove the original edge in the database. Still remains in memory, though, as noted above.
         edge.delete()
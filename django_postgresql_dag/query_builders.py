@@ -1,9 +1,19 @@
 from abc import ABC, abstractmethod
+from functools import lru_cache
 from django.core.exceptions import ImproperlyConfigured
 
 from .utils import get_foreign_key_field, get_instance_characteristics
 
 
+@lru_cache(maxsize=128)
+def _compile_query(query, **kwargs):
+    """
+    Returns the query with table names, pk details, and where clauses substituted in. Values are always passed as
+    query parameters, so the result only varies with the shape of the query and can be reused across instances.
+    """
+    return query.format(**kwargs)
+
+
 class BaseQuery(ABC):
     """
     Base Query Class
@@ -33,6 +43,12 @@ class BaseQuery(ABC):
         self.allowed_nodes_queryset = allowed_nodes_queryset
         self.allowed_edges_queryset = allowed_edges_queryset
 
+        # Resolve the filtering querysets to lists of pks once, rather than evaluating them each time a clause is built
+        self.disallowed_node_pks = self._pk_list(self.disallowed_nodes_queryset)
+        self.disallowed_edge_pks = self._pk_list(self.disallowed_edges_queryset)
+        self.allowed_node_pks = self._pk_list(self.allowed_nodes_queryset)
+        self.allowed_edge_pks = self._pk_list(self.allowed_edges_queryset)
+
         if self.instance is not None:
             self.query_parameters = {
                 "pk": self.instance.pk,
@@ -60,6 +76,13 @@ class BaseQuery(ABC):
         self.edge_model_table = self.edge_model._meta.db_table
         super().__init__()
 
+    @staticmethod
+    def _pk_list(queryset):
+        """Returns a list of the pks in the provided queryset, or None if no queryset was provided"""
+        if queryset is None:
+            return None
+        return list(queryset.values_list("pk", flat=True))
+
     def limit_to_nodes_set_fk(self):
         """
         Limits the search to those nodes which are included in a ForeignKey's node set
@@ -96,7 +119,7 @@ class BaseQuery(ABC):
         """
         A queryset of Nodes that MUST NOT be included in the query
         """
-        if not self.disallowed_nodes_queryset:
+        if not self.disallowed_node_pks:
             return
         else:
             return self._disallow_nodes()
@@ -110,7 +133,7 @@ class BaseQuery(ABC):
         """
         A queryset of Edges that MUST NOT be included in the query
         """
-        if not self.disallowed_edges_queryset:
+        if not self.disallowed_edge_pks:
             return
         else:
             return self._disallow_edges()
@@ -124,7 +147,7 @@ class BaseQuery(ABC):
         """
         A queryset of Edges that MAY be included in the query
         """
-        if not self.allowed_nodes_queryset:
+        if not self.allowed_node_pks:
             return
         else:
             return self._allow_nodes()
@@ -138,7 +161,7 @@ class BaseQuery(ABC):
         """
         A queryset of Edges that MAY be included in the query
         """
-        if not self.allowed_edges_queryset:
+        if not self.allowed_edge_pks:
             return
         else:
             return self._allow_edges()
@@ -168,7 +191,7 @@ class BaseQuery(ABC):
 
     def id_list(self):
         """Returns a list of ids in the resulting query"""
-        return [item.pk for item in self.raw_queryset()]
+        return [item.pk for item in self.raw_queryset().iterator()]
 
     def __str__(self):
         """Returns a string representation of the RawQueryset"""
@@ -227,9 +250,7 @@ class AncestorQuery(BaseQuery):
             relationship_table=self.edge_model_table,
             # pk_name=self.instance.get_pk_name(),
         )
-        self.query_parameters["disallowed_node_pks"] = str(
-            set(self.disallowed_nodes_queryset.values_list("pk", flat=True))
-        )
+        self.query_parameters["disallowed_node_pks"] = self.disallowed_node_pks
 
         return
 
@@ -248,7 +269,7 @@ class AncestorQuery(BaseQuery):
             relationship_table=self.edge_model_table,
             # pk_name=self.instance.get_pk_name(),
         )
-        self.query_parameters["allowed_node_pks"] = str(set(self.allowed_nodes_queryset.values_list("pk", flat=True)))
+        self.query_parameters["allowed_node_pks"] = self.allowed_node_pks
 
         return
 
@@ -287,7 +308,8 @@ class AncestorQuery(BaseQuery):
         """
 
         return self.node_model.objects.raw(
-            QUERY.format(
+            _compile_query(
+                QUERY,
                 relationship_table=self.edge_model_table,
                 pk_name=self.instance.get_pk_name(),
                 where_clauses_part_1=self.where_clauses_part_1,
@@ -345,9 +367,7 @@ class DescendantQuery(BaseQuery):
             relationship_table=self.edge_model_table,
             # pk_name=self.instance.get_pk_name(),
         )
-        self.query_parameters["disallowed_node_pks"] = str(
-            set(self.disallowed_nodes_queryset.values_list("pk", flat=True))
-        )
+        self.query_parameters["disallowed_node_pks"] = self.disallowed_node_pks
 
         return
 
@@ -366,7 +386,7 @@ class DescendantQuery(BaseQuery):
             relationship_table=self.edge_model_table,
             # pk_name=self.instance.get_pk_name(),
         )
-        self.query_parameters["allowed_node_pks"] = str(set(self.allowed_nodes_queryset.values_list("pk", flat=True)))
+        self.query_parameters["allowed_node_pks"] = self.allowed_node_pks
 
         return
 
@@ -399,7 +419,8 @@ class DescendantQuery(BaseQuery):
         """
 
         return self.node_model.objects.raw(
-            QUERY.format(
+            _compile_query(
+                QUERY,
                 relationship_table=self.edge_model_table,
                 pk_name=self.instance.get_pk_name(),
                 where_clauses_part_1=self.where_clauses_part_1,
@@ -457,7 +478,8 @@ class ConnectedGraphQuery(BaseQuery):
         """
 
         return self.node_model.objects.raw(
-            QUERY.format(
+            _compile_query(
+                QUERY,
                 relationship_table=self.edge_model_table,
                 pk_name=self.instance.get_pk_name(),
                 pk_type=self.starting_node.get_pk_type(),
@@ -494,12 +516,11 @@ class UpwardPathQuery(BaseQuery):
         return
 
     def _disallow_nodes(self):
-        DISALLOWED_NODES_CLAUSE = """AND second.parent_id <> ALL('{disallowed_path_node_pks}')"""
+        DISALLOWED_NODES_CLAUSE = """AND first.parent_id <> ALL(%(disallowed_path_node_pks)s)"""
 
+        self.where_clauses_part_1 += "\n" + DISALLOWED_NODES_CLAUSE
         self.where_clauses_part_2 += "\n" + DISALLOWED_NODES_CLAUSE
-        self.query_parameters["disallowed_path_node_pks"] = str(
-            set(self.disallowed_nodes_queryset.values_list("pk", flat=True))
-        )
+        self.query_parameters["disallowed_path_node_pks"] = self.disallowed_node_pks
 
         return
 
@@ -507,12 +528,11 @@ class UpwardPathQuery(BaseQuery):
         return
 
     def _allow_nodes(self):
-        ALLOWED_NODES_CLAUSE = """AND second.parent_id = ALL('{allowed_path_node_pks}')"""
+        ALLOWED_NODES_CLAUSE = """AND first.parent_id = ANY(%(allowed_path_node_pks)s)"""
 
+        self.where_clauses_part_1 += "\n" + ALLOWED_NODES_CLAUSE
         self.where_clauses_part_2 += "\n" + ALLOWED_NODES_CLAUSE
-        self.query_parameters["allowed_path_node_pks"] = str(
-            set(self.allowed_nodes_queryset.values_list("pk", flat=True))
-        )
+        self.query_parameters["allowed_path_node_pks"] = self.allowed_node_pks
 
         return
 
@@ -531,6 +551,7 @@ class UpwardPathQuery(BaseQuery):
                 ARRAY[first.child_id] AS path
                 FROM {relationship_table} AS first
             WHERE child_id = %(starting_node)s
+            {where_clauses_part_1}
         UNION ALL
             SELECT
                 first.child_id,
@@ -558,10 +579,12 @@ class UpwardPathQuery(BaseQuery):
         """
 
         return self.node_model.objects.raw(
-            QUERY.format(
+            _compile_query(
+                QUERY,
                 relationship_table=self.edge_model_table,
                 pk_name=self.starting_node.get_pk_name(),
                 pk_type=self.starting_node.get_pk_type(),
+                where_clauses_part_1=self.where_clauses_part_1,
                 where_clauses_part_2=self.where_clauses_part_2,
             ),
             self.query_parameters,
@@ -596,12 +619,11 @@ class DownwardPathQuery(BaseQuery):
         return
 
     def _disallow_nodes(self):
-        DISALLOWED_NODES_CLAUSE = """AND second.child_id <> ALL('{disallowed_path_node_pks}')"""
+        DISALLOWED_NODES_CLAUSE = """AND first.child_id <> ALL(%(disallowed_path_node_pks)s)"""
 
+        self.where_clauses_part_1 += "\n" + DISALLOWED_NODES_CLAUSE
         self.where_clauses_part_2 += "\n" + DISALLOWED_NODES_CLAUSE
-        self.query_parameters["disallowed_path_node_pks"] = str(
-            set(self.disallowed_nodes_queryset.values_list("pk", flat=True))
-        )
+        self.query_parameters["disallowed_path_node_pks"] = self.disallowed_node_pks
 
         return
 
@@ -609,12 +631,11 @@ class DownwardPathQuery(BaseQuery):
         return
 
     def _allow_nodes(self):
-        ALLOWED_NODES_CLAUSE = """AND second.child_id = ALL('{allowed_path_node_pks}')"""
+        ALLOWED_NODES_CLAUSE = """AND first.child_id = ANY(%(allowed_path_node_pks)s)"""
 
+        self.where_clauses_part_1 += "\n" + ALLOWED_NODES_CLAUSE
         self.where_clauses_part_2 += "\n" + ALLOWED_NODES_CLAUSE
-        self.query_parameters["allowed_path_node_pks"] = str(
-            set(self.allowed_nodes_queryset.values_list("pk", flat=True))
-        )
+        self.query_parameters["allowed_path_node_pks"] = self.allowed_node_pks
 
         return
 
@@ -633,6 +654,7 @@ class DownwardPathQuery(BaseQuery):
                 ARRAY[first.parent_id] AS path
                 FROM {relationship_table} AS first
             WHERE parent_id = %(starting_node)s
+            {where_clauses_part_1}
         UNION ALL
             SELECT
                 first.parent_id,
@@ -660,10 +682,12 @@ class DownwardPathQuery(BaseQuery):
         """
 
         return self.node_model.objects.raw(
-            QUERY.format(
+            _compile_query(
+                QUERY,
                 relationship_table=self.edge_model_table,
                 pk_name=self.starting_node.get_pk_name(),
                 pk_type=self.starting_node.get_pk_type(),
+                where_clauses_part_1=self.where_clauses_part_1,
                 where_clauses_part_2=self.where_clauses_part_2,
             ),
             self.query_parameters,
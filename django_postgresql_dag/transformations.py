@@ -41,6 +41,11 @@ def nx_from_queryset(
     else:
         graph = nx.DiGraph(**graph_attributes_dict)
 
+    # Evaluating the queryset here fills its result cache for the loops below; if it is empty, there is no need to
+    # query for the related nodes or edges at all
+    if not queryset:
+        return graph
+
     if queryset_type == "nodes_queryset":
         nodes_queryset = queryset
         edges_queryset = edges_from_nodes_queryset(nodes_queryset)
@@ -62,6 +67,6 @@ def nx_from_queryset(
         else:
             edge_attribute_fields_dict = {}
 
-        graph.add_edge(edge.parent.pk, edge.child.pk, **edge_attribute_fields_dict)
+        graph.add_edge(edge.parent_id, edge.child_id, **edge_attribute_fields_dict)
 
     return graph
@@ -3,6 +3,7 @@ Functions for transforming RawQuerySet or other outputs of
 django-postgresql-dag to alternate formats.
 """
 import inspect
+from functools import lru_cache
 from itertools import chain
 
 from django.core.exceptions import FieldDoesNotExist
@@ -39,25 +40,29 @@ def _ordered_filter(queryset, field_names, values):
     return queryset.filter(**filter_condition).order_by(order_by)
 
 
-def get_instance_characteristics(instance):
+@lru_cache(maxsize=None)
+def _get_model_characteristics(model):
     """
-    Returns a tuple of the node & edge model classes and the instance_type
-    for the provided instance
+    Returns a tuple of the node & edge model classes and the model type ("node" or "edge")
+    for the provided model class. The result only depends on the model class, so it is cached.
     """
     try:
-        # Assume a queryset of nodes was provided
-        _NodeModel = instance._meta.model
-        _EdgeModel = instance._meta.model._meta.get_field("parents").through
-        instance_type = "node"
+        # Assume a node model was provided
+        return (model, model._meta.get_field("parents").through, "node")
     except FieldDoesNotExist:
         try:
-            # Assume a queryset of edges was provided
-            _EdgeModel = instance._meta.model
-            _NodeModel = instance._meta.model._meta.get_field("parent").related_model
-            instance_type = "edge"
+            # Assume an edge model was provided
+            return (model._meta.get_field("parent").related_model, model, "edge")
         except FieldDoesNotExist:
             raise GraphModelsCannotBeParsedException
-    return (_NodeModel, _EdgeModel, instance_type)
+
+
+def get_instance_characteristics(instance):
+    """
+    Returns a tuple of the node & edge model classes and the instance_type
+    for the provided instance
+    """
+    return _get_model_characteristics(instance._meta.model)
 
 
 def get_foreign_key_field(edge_model, fk_instance):
@@ -77,20 +82,8 @@ def get_queryset_characteristics(queryset):
     Returns a tuple of the node & edge model classes and the queryset type
     for the provided queryset
     """
-    try:
-        # Assume a queryset of nodes was provided
-        _NodeModel = queryset.model
-        _EdgeModel = queryset.model._meta.get_field("parents").through
-        queryset_type = "nodes_queryset"
-    except FieldDoesNotExist:
-        try:
-            # Assume a queryset of edges was provided
-            _EdgeModel = queryset.model
-            _NodeModel = queryset.model._meta.get_field("parent").related_model
-            queryset_type = "edges_queryset"
-        except FieldDoesNotExist:
-            raise GraphModelsCannotBeParsedException
-    return (_NodeModel, _EdgeModel, queryset_type)
+    _NodeModel, _EdgeModel, model_type = _get_model_characteristics(queryset.model)
+    return (_NodeModel, _EdgeModel, f"{model_type}s_queryset")
 
 
 def model_to_dict(instance, fields=None, date_strf=None):
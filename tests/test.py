@@ -1,6 +1,7 @@
 import logging
 import multiprocessing
 import time
+import unittest
 
 from django.test import TestCase
 from django.core.exceptions import ValidationError
@@ -9,11 +10,12 @@ from django_postgresql_dag.exceptions import (
     GraphModelsCannotBeParsedException,
     IncorrectUsageException,
 )
-from django_postgresql_dag.transformations import (
+from django_postgresql_dag.utils import (
     _ordered_filter,
     edges_from_nodes_queryset,
+    get_instance_characteristics,
+    get_queryset_characteristics,
     nodes_from_edges_queryset,
-    nx_from_queryset,
     model_to_dict,
 )
 from django_postgresql_dag.query_builders import (
@@ -26,6 +28,13 @@ from django_postgresql_dag.query_builders import (
 
 from .models import NetworkNode, NetworkEdge, NodeSet, EdgeSet
 
+try:
+    from django_postgresql_dag.transformations import nx_from_queryset
+
+    HAS_NETWORKX = True
+except ImportError:
+    HAS_NETWORKX = False
+
 logging.basicConfig(level=logging.DEBUG)
 
 
@@ -33,15 +42,15 @@ node_name_list = ["root", "a1", "a2", "a3", "b1", "b2", "b3", "b4", "c1", "c2"]
 
 
 class DagTestCase(TestCase):
-    def setUp(self):
-        for node in node_name_list:
-            NetworkNode.objects.create(name=node)
+    @classmethod
+    def setUpTestData(cls):
+        NetworkNode.objects.bulk_create([NetworkNode(name=node) for node in node_name_list])
 
     def test_01_objects_were_created(self):
         log = logging.getLogger("test_01")
         log.debug("Creating objects")
-        for node in node_name_list:
-            self.assertEqual(NetworkNode.objects.get(name=f"{node}").name, f"{node}")
+        created_names = list(NetworkNode.objects.filter(name__in=node_name_list).values_list("name", flat=True))
+        self.assertCountEqual(created_names, node_name_list)
         log.debug("Done creating objects")
 
     def test_02_dag(self):
@@ -54,8 +63,8 @@ class DagTestCase(TestCase):
         log.debug("Done getting nodes")
 
         # Creates a DAG
-        root.add_child(a1)
-        b1.add_parent(a1)
+        root_a1 = root.add_child(a1)
+        a1_b1 = b1.add_parent(a1)
 
         log.debug("descendants_tree")
         tree = root.descendants_tree()
@@ -65,36 +74,46 @@ class DagTestCase(TestCase):
         self.assertEqual(tree[a1][b1], {})
 
         log.debug("descendants part 1")
-        root_descendants = root.descendants()
-        self.assertNotIn(root, root_descendants)
-        self.assertTrue(all(elem in root_descendants for elem in [a1, b1]))
+        root_descendant_pks = set(root.descendants().values_list("pk", flat=True))
+        self.assertNotIn(root.pk, root_descendant_pks)
+        self.assertLessEqual({a1.pk, b1.pk}, root_descendant_pks)
 
         root.add_child(a2)
         a3.add_parent(root)
         a3.add_child(b3)
         a3.add_child(b4)
-        b3.add_child(c1)
+        b3_c1 = b3.add_child(c1)
 
         log.debug("descendants part 2")
-        root_descendants = root.descendants()
-        self.assertNotIn(root, root_descendants)
-        self.assertTrue(all(elem in root_descendants for elem in [a1, a2, a3, b1, b3, b4, c1]))
+        root_descendant_pks = set(root.descendants().values_list("pk", flat=True))
+        self.assertNotIn(root.pk, root_descendant_pks)
+        self.assertLessEqual({a1.pk, a2.pk, a3.pk, b1.pk, b3.pk, b4.pk, c1.pk}, root_descendant_pks)
 
         log.debug("ancestors part 1")
-        c1_ancestors = c1.ancestors()
-        self.assertNotIn(c1, c1_ancestors)
-        self.assertNotIn(b4, c1_ancestors)
-        self.assertTrue(all(elem in c1_ancestors for elem in [root, a3, b3]))
+        c1_ancestor_pks = set(c1.ancestors().values_list("pk", flat=True))
+        self.assertNotIn(c1.pk, c1_ancestor_pks)
+        self.assertNotIn(b4.pk, c1_ancestor_pks)
+        self.assertLessEqual({root.pk, a3.pk, b3.pk}, c1_ancestor_pks)
 
-        a1.add_child(b2)
+        a1_b2 = a1.add_child(b2)
         a2.add_child(b2)
         b3.add_child(c2)
-        b4.add_child(c1)
+
+        # Adding an edge runs the circular check's CTE, followed by the INSERT
+        with self.assertNumQueries(2):
+            b4.add_child(c1)
 
         log.debug("ancestors part 2")
-        c1_ancestors = c1.ancestors()
-        self.assertNotIn(c1, c1_ancestors)
-        self.assertTrue(all(elem in c1_ancestors for elem in [root, a3, b3, b4]))
+        c1_ancestor_pks = set(c1.ancestors().values_list("pk", flat=True))
+        self.assertNotIn(c1.pk, c1_ancestor_pks)
+        self.assertLessEqual({root.pk, a3.pk, b3.pk, b4.pk}, c1_ancestor_pks)
+
+        # Traversals run the recursive CTE, then fetch the ordered nodes
+        log.debug("traversal query counts")
+        with self.assertNumQueries(2):
+            list(root.descendants())
+        with self.assertNumQueries(2):
+            list(c1.ancestors())
 
         # Try to add a node that is already an ancestor
         try:
@@ -114,9 +133,16 @@ class DagTestCase(TestCase):
         except ValidationError as e:
             self.assertEqual(e.message, "The object is an ancestor.")
 
+        # Try to add a node that is already a descendant while disallowing duplicate edges
+        with self.assertRaises(ValidationError) as cm:
+            root.add_child(c1, allow_duplicate_edges=False)
+        self.assertEqual(cm.exception.message, "The edge is a duplicate.")
+
         # Verify that the tree methods work
         log.debug("descendants_tree")
-        tree_from_root = root.descendants_tree()
+        # One edge query per generation, starting from root, a*, b* and c*
+        with self.assertNumQueries(4):
+            tree_from_root = root.descendants_tree()
         self.assertIn(a1, tree_from_root)
         self.assertIn(a2, tree_from_root)
         self.assertIn(a3, tree_from_root)
@@ -148,31 +174,32 @@ class DagTestCase(TestCase):
 
         # Check other ancestor methods
         log.debug("ancestors_and_self")
-        self.assertEqual(a1.ancestors_and_self()[0], root)
-        log.debug("ancestors_and_self")
-        self.assertEqual(a1.ancestors_and_self()[1], a1)
-        log.debug("self_and_ancestors")
-        self.assertEqual(a1.self_and_ancestors()[0], a1)
+        a1_ancestors_and_self = list(a1.ancestors_and_self())
+        self.assertEqual(a1_ancestors_and_self[0], root)
+        self.assertEqual(a1_ancestors_and_self[1], a1)
         log.debug("self_and_ancestors")
-        self.assertEqual(a1.self_and_ancestors()[1], root)
+        a1_self_and_ancestors = list(a1.self_and_ancestors())
+        self.assertEqual(a1_self_and_ancestors[0], a1)
+        self.assertEqual(a1_self_and_ancestors[1], root)
 
         # Check other descendant methods
         log.debug("descendants_and_self")
-        self.assertEqual(b4.descendants_and_self()[0], c1)
-        log.debug("descendants_and_self")
-        self.assertEqual(b4.descendants_and_self()[1], b4)
-        log.debug("self_and_descendants")
-        self.assertEqual(b4.self_and_descendants()[0], b4)
+        b4_descendants_and_self = list(b4.descendants_and_self())
+        self.assertEqual(b4_descendants_and_self[0], c1)
+        self.assertEqual(b4_descendants_and_self[1], b4)
         log.debug("self_and_descendants")
-        self.assertEqual(b4.self_and_descendants()[1], c1)
+        b4_self_and_descendants = list(b4.self_and_descendants())
+        self.assertEqual(b4_self_and_descendants[0], b4)
+        self.assertEqual(b4_self_and_descendants[1], c1)
 
         # Check clan methods
         log.debug("clan_ids")
-        self.assertTrue(all(elem in a1.clan() for elem in [root, a1, b1, b2]))
+        a1_clan_pks = tuple(a1.clan().values_list("pk", flat=True))
+        self.assertLessEqual({root.pk, a1.pk, b1.pk, b2.pk}, set(a1_clan_pks))
         log.debug("clan")
-        self.assertEqual(a1.clan()[0], root)
+        self.assertEqual(a1_clan_pks[0], root.pk)
         log.debug("clan")
-        self.assertEqual(a1.clan()[3], b2)
+        self.assertEqual(a1_clan_pks[3], b2.pk)
 
         # Check distance between nodes
         log.debug("distance")
@@ -180,17 +207,65 @@ class DagTestCase(TestCase):
 
         # Test additional fields for edge
         self.assertEqual(b3.children.through.objects.filter(child=c1)[0].name, "b3 c1")
-        self.assertEqual(b3.descendants_edges().first(), NetworkEdge.objects.get(parent=b3, child=c1))
-        self.assertEqual(a1.ancestors_edges().first(), NetworkEdge.objects.get(parent=root, child=a1))
-        self.assertTrue(NetworkEdge.objects.get(parent=a1, child=b2) in a1.clan_edges())
-        self.assertTrue(NetworkEdge.objects.get(parent=a1, child=b1) in a1.clan_edges())
-        self.assertTrue(NetworkEdge.objects.get(parent=root, child=a1) in a1.clan_edges())
+        self.assertEqual(b3.descendants_edges().first(), b3_c1)
+        self.assertEqual(a1.ancestors_edges().first(), root_a1)
+        self.assertTrue(a1_b2 in a1.clan_edges())
+        self.assertTrue(a1_b1 in a1.clan_edges())
+        self.assertTrue(root_a1 in a1.clan_edges())
+
+        self.assertEqual(
+            set(NetworkEdge.objects.from_nodes_queryset(a1.clan())),
+            set(NetworkEdge.objects.filter(parent__in=[root, a1], child__in=[a1, b1, b2])),
+        )
+        c1_ancestor_edges = set(NetworkEdge.objects.filter(parent__in=[root, a3], child__in=[a3, b3, b4]))
+        self.assertEqual(set(NetworkEdge.objects.from_nodes_queryset(c1.ancestors_raw())), c1_ancestor_edges)
+        self.assertEqual(set(NetworkEdge.objects.from_nodes_queryset([root, a3, b3, b4])), c1_ancestor_edges)
+
+        # Test model characteristics lookups
+        self.assertEqual(get_instance_characteristics(root), (NetworkNode, NetworkEdge, "node"))
+        self.assertEqual(get_instance_characteristics(root_a1), (NetworkNode, NetworkEdge, "edge"))
+        self.assertEqual(get_queryset_characteristics(a1.clan()), (NetworkNode, NetworkEdge, "nodes_queryset"))
+        self.assertEqual(get_queryset_characteristics(a1.clan_edges()), (NetworkNode, NetworkEdge, "edges_queryset"))
+
+        # Test sorting of edges
+        c1_ancestors_edges = c1.ancestors_edges()
+        sorted_edges = NetworkEdge.objects.sort(c1_ancestors_edges)
+        self.assertEqual(len(sorted_edges), c1_ancestors_edges.count())
+        # Each edge must start at a root or at a node already reached by an earlier edge
+        root_pks = {edge.parent_id for edge in sorted_edges} - {edge.child_id for edge in sorted_edges}
+        self.assertEqual(root_pks, {root.pk})
+        reached_pks = set()
+        for edge in sorted_edges:
+            self.assertIn(edge.parent_id, root_pks | reached_pks)
+            reached_pks.add(edge.child_id)
 
         # Test shortest_path
         log.debug("path x2")
         self.assertTrue(
-            [p.name for p in root.path(c1)] == ["root", "a3", "b3", "c1"]
-            or [p.name for p in c1.path(root, directional=False)] == ["root", "a3", "b4", "c1"]
+            list(root.path(c1).values_list("name", flat=True)) == ["root", "a3", "b3", "c1"]
+            or list(c1.path(root, directional=False).values_list("name", flat=True)) == ["root", "a3", "b4", "c1"]
+        )
+
+        log.debug("path with disallowed nodes")
+        disallowed_nodes = NetworkNode.objects.filter(pk=b3.pk)
+        self.assertEqual(
+            list(root.path(c1, disallowed_nodes_queryset=disallowed_nodes).values_list("name", flat=True)),
+            ["root", "a3", "b4", "c1"],
+        )
+        self.assertEqual(
+            list(
+                c1.path(root, directional=False, disallowed_nodes_queryset=disallowed_nodes).values_list(
+                    "name", flat=True
+                )
+            ),
+            ["c1", "b4", "a3", "root"],
+        )
+
+        log.debug("path with allowed nodes")
+        allowed_nodes = NetworkNode.objects.filter(pk__in=[root.pk, a3.pk, b4.pk, c1.pk])
+        self.assertEqual(
+            list(root.path(c1, allowed_nodes_queryset=allowed_nodes).values_list("name", flat=True)),
+            ["root", "a3", "b4", "c1"],
         )
 
         log.debug("path")
@@ -200,10 +275,8 @@ class DagTestCase(TestCase):
             self.assertRaises(NodeNotReachableException)
 
         log.debug("shortest_path x2")
-        self.assertTrue(
-            [p.name for p in c1.path(root, directional=False)] == ["c1", "b3", "a3", "root"]
-            or [p.name for p in c1.path(root, directional=False)] == ["c1", "b4", "a3", "root"]
-        )
+        c1_root_path = list(c1.path(root, directional=False).values_list("name", flat=True))
+        self.assertIn(c1_root_path, [["c1", "b3", "a3", "root"], ["c1", "b4", "a3", "root"]])
 
         log.debug("get_leaves")
         self.assertEqual(set([p.name for p in root.leaves()]), set(["b2", "c1", "c2", "b1"]))
@@ -217,253 +290,55 @@ class DagTestCase(TestCase):
         self.assertFalse(a1.is_leaf())
         self.assertFalse(a1.is_root())
 
+        node_classes = NetworkNode.objects.classify()
+        self.assertEqual(node_classes[root.pk], "root")
+        self.assertEqual(node_classes[c1.pk], "leaf")
+        self.assertEqual(node_classes[a1.pk], "internal")
+        self.assertEqual(set(NetworkNode.objects.roots()), {root})
+        self.assertEqual(set(NetworkNode.objects.leaves()), {b1, b2, c1, c2})
+
         # Remove a node and test island
         log.debug("descendants")
-        self.assertTrue(c2 in b3.descendants())
+        self.assertTrue(b3.descendants().filter(pk=c2.pk).exists())
         log.debug("ancestors")
-        self.assertEqual([p.name for p in c2.ancestors()], ["root", "a3", "b3"])
+        self.assertEqual(list(c2.ancestors().values_list("name", flat=True)), ["root", "a3", "b3"])
         c2.remove_parent(b3)
         log.debug("descendants")
-        self.assertFalse(c2 in b3.descendants())
+        self.assertFalse(b3.descendants().filter(pk=c2.pk).exists())
         log.debug("ancestors")
-        self.assertEqual([p.name for p in c2.ancestors()], [])
+        self.assertEqual(list(c2.ancestors().values_list("name", flat=True)), [])
         self.assertTrue(c2.is_island())
+        self.assertEqual(NetworkNode.objects.classify()[c2.pk], "island")
 
         # Remove a node and test that it is still connected elsewhere
         log.debug("descendants")
-        self.assertTrue(c1 in b3.descendants())
+        self.assertTrue(b3.descendants().filter(pk=c1.pk).exists())
         log.debug("ancestors")
-        self.assertEqual([p.name for p in c1.ancestors()], ["root", "a3", "b3", "b4"])
+        self.assertEqual(list(c1.ancestors().values_list("name", flat=True)), ["root", "a3", "b3", "b4"])
         b3.remove_child(c1)
         log.debug("descendants")
-        self.assertFalse(c1 in b3.descendants())
+        self.assertFalse(b3.descendants().filter(pk=c1.pk).exists())
         log.debug("ancestors")
-        self.assertEqual([p.name for p in c1.ancestors()], ["root", "a3", "b4"])
+        self.assertEqual(list(c1.ancestors().values_list("name", flat=True)), ["root", "a3", "b4"])
         self.assertFalse(c1.is_island())
 
-        # Test is we can properly export to a NetworkX graph
-        log = logging.getLogger("test_02_networkx")
-        nx_out = nx_from_queryset(
-            c1.ancestors_and_self(),
-            graph_attributes_dict={"test": "test"},
-            node_attribute_fields_list=["id", "name"],
-            edge_attribute_fields_list=["id", "name"],
-        )
-        log.debug("Check attributes")
-        self.assertEqual(nx_out.graph, {"test": "test"})
-        self.assertEqual(nx_out.nodes[root.pk], {"id": root.pk, "name": "root"})
-        self.assertEqual(
-            nx_out.edges[root.pk, a3.pk], {"id": NetworkEdge.objects.get(parent=root, child=a3).pk, "name": "root a3"}
-        )
-
         """
         Simulate a basic irrigation canal network
         """
         log = logging.getLogger("test_02_canal")
 
-        node_name_list2 = [x for x in range(0, 201)]
-        adjacency_list = [
-            ["0", "1"],
-            ["1", "2"],
-            ["2", "3"],
-            ["3", "4"],
-            ["4", "5"],
-            ["5", "6"],
-            ["6", "7"],
-            ["7", "8"],
-            ["8", "9"],
-            ["9", "10"],
-            ["10", "11"],
-            ["11", "12"],
-            ["12", "13"],
-            ["13", "14"],
-            ["14", "15"],
-            ["5", "16"],
-            ["16", "17"],
-            ["17", "18"],
-            ["18", "19"],
-            ["19", "20"],
-            ["10", "21"],
-            ["21", "22"],
-            ["22", "23"],
-            ["23", "24"],
-            ["24", "25"],
-            ["15", "26"],
-            ["26", "27"],
-            ["27", "28"],
-            ["28", "29"],
-            ["29", "30"],
-            ["30", "31"],
-            ["31", "32"],
-            ["32", "33"],
-            ["33", "34"],
-            ["34", "35"],
-            ["35", "36"],
-            ["36", "37"],
-            ["37", "38"],
-            ["38", "39"],
-            ["39", "40"],
-            ["30", "41"],
-            ["41", "42"],
-            ["42", "43"],
-            ["43", "44"],
-            ["44", "45"],
-            ["35", "46"],
-            ["46", "47"],
-            ["47", "48"],
-            ["48", "49"],
-            ["49", "50"],
-            ["25", "51"],
-            ["51", "52"],
-            ["52", "53"],
-            ["53", "54"],
-            ["54", "55"],
-            ["55", "56"],
-            ["56", "57"],
-            ["57", "58"],
-            ["58", "59"],
-            ["59", "60"],
-            ["60", "61"],
-            ["61", "62"],
-            ["62", "63"],
-            ["63", "64"],
-            ["64", "65"],
-            ["55", "66"],
-            ["66", "67"],
-            ["67", "68"],
-            ["68", "69"],
-            ["69", "70"],
-            ["60", "71"],
-            ["71", "72"],
-            ["72", "73"],
-            ["73", "74"],
-            ["74", "75"],
-            ["50", "76"],
-            ["76", "77"],
-            ["77", "78"],
-            ["78", "79"],
-            ["79", "80"],
-            ["80", "81"],
-            ["81", "82"],
-            ["82", "83"],
-            ["83", "84"],
-            ["84", "85"],
-            ["85", "86"],
-            ["86", "87"],
-            ["87", "88"],
-            ["88", "89"],
-            ["89", "90"],
-            ["80", "91"],
-            ["91", "92"],
-            ["92", "93"],
-            ["93", "94"],
-            ["94", "95"],
-            ["85", "96"],
-            ["96", "97"],
-            ["97", "98"],
-            ["98", "99"],
-            ["99", "100"],
-            ["65", "101"],
-            ["101", "102"],
-            ["102", "103"],
-            ["103", "104"],
-            ["104", "105"],
-            ["105", "106"],
-            ["106", "107"],
-            ["107", "108"],
-            ["108", "109"],
-            ["109", "110"],
-            ["110", "111"],
-            ["111", "112"],
-            ["112", "113"],
-            ["113", "114"],
-            ["114", "115"],
-            ["105", "116"],
-            ["116", "117"],
-            ["117", "118"],
-            ["118", "119"],
-            ["119", "120"],
-            ["110", "121"],
-            ["121", "122"],
-            ["122", "123"],
-            ["123", "124"],
-            ["124", "125"],
-            ["75", "126"],
-            ["126", "127"],
-            ["127", "128"],
-            ["128", "129"],
-            ["129", "130"],
-            ["130", "131"],
-            ["131", "132"],
-            ["132", "133"],
-            ["133", "134"],
-            ["134", "135"],
-            ["135", "136"],
-            ["136", "137"],
-            ["137", "138"],
-            ["138", "139"],
-            ["139", "140"],
-            ["130", "141"],
-            ["141", "142"],
-            ["142", "143"],
-            ["143", "144"],
-            ["144", "145"],
-            ["135", "146"],
-            ["146", "147"],
-            ["147", "148"],
-            ["148", "149"],
-            ["149", "150"],
-            ["90", "151"],
-            ["151", "152"],
-            ["152", "153"],
-            ["153", "154"],
-            ["154", "155"],
-            ["155", "156"],
-            ["156", "157"],
-            ["157", "158"],
-            ["158", "159"],
-            ["159", "160"],
-            ["160", "161"],
-            ["161", "162"],
-            ["162", "163"],
-            ["163", "164"],
-            ["164", "165"],
-            ["155", "166"],
-            ["166", "167"],
-            ["167", "168"],
-            ["168", "169"],
-            ["169", "170"],
-            ["160", "171"],
-            ["171", "172"],
-            ["172", "173"],
-            ["173", "174"],
-            ["174", "175"],
-            ["100", "176"],
-            ["176", "177"],
-            ["177", "178"],
-            ["178", "179"],
-            ["179", "180"],
-            ["180", "181"],
-            ["181", "182"],
-            ["182", "183"],
-            ["183", "184"],
-            ["184", "185"],
-            ["185", "186"],
-            ["186", "187"],
-            ["187", "188"],
-            ["188", "189"],
-            ["189", "190"],
-            ["180", "191"],
-            ["191", "192"],
-            ["192", "193"],
-            ["193", "194"],
-            ["194", "195"],
-            ["185", "196"],
-            ["196", "197"],
-            ["197", "198"],
-            ["198", "199"],
-            ["199", "200"],
-        ]
+        # Main-channel nodes are keyed by int and side-channel nodes by their "SA1"-style name
+        node_name_list2 = list(range(0, 201))
+        # The canal is made of eight 25-node sections. Each section has a 15-node main channel fed from a node
+        # in an earlier section, plus two 5-node side channels branching off the main channel's 5th and 10th nodes
+        adjacency_list = []
+        for section, source in enumerate([0, 15, 25, 50, 65, 75, 90, 100]):
+            base = section * 25
+            channels = [(source, base + 1, 15), (base + 5, base + 16, 5), (base + 10, base + 21, 5)]
+            for parent, first, length in channels:
+                for child in range(first, first + length):
+                    adjacency_list.append((parent, child))
+                    parent = child
 
         for n in range(1, 200):
             if n % 5 != 0:
@@ -471,41 +346,49 @@ class DagTestCase(TestCase):
                 node_name_list2.append(f"SB{n}")
                 node_name_list2.append(f"SC{n}")
 
-                adjacency_list.append([f"{n}", f"SA{n}"])
-                adjacency_list.append([f"SA{n}", f"SB{n}"])
-                adjacency_list.append([f"SA{n}", f"SC{n}"])
+                adjacency_list.append((n, f"SA{n}"))
+                adjacency_list.append((f"SA{n}", f"SB{n}"))
+                adjacency_list.append((f"SA{n}", f"SC{n}"))
 
-        # Create and assign nodes to variables
+        # Create the nodes in bulk, mapping each name to its pk
         log.debug("Start creating nodes")
-        for node in node_name_list2:
-            globals()[f"{node}"] = NetworkNode.objects.create(name=node)
+        canal_nodes = NetworkNode.objects.bulk_create([NetworkNode(name=str(node)) for node in node_name_list2])
+        canal_pks = {key: node.pk for key, node in zip(node_name_list2, canal_nodes)}
         log.debug("Done creating nodes")
 
         log.debug("Connect nodes")
-        for connection in adjacency_list:
-            globals()[f"{connection[0]}"].add_child(globals()[f"{connection[1]}"])
+        NetworkEdge.objects.bulk_create(
+            [
+                NetworkEdge(parent_id=canal_pks[parent], child_id=canal_pks[child], name=f"{parent} {child}")
+                for parent, child in adjacency_list
+            ]
+        )
+
+        # The main-channel nodes were created first, so both ends of the canal can be indexed without a query
+        canal_root = canal_nodes[0]
+        canal_leaf = canal_nodes[200]
 
         # Compute descendants of a root node
-        canal_root = NetworkNode.objects.get(name="0")
-        start_time = time.time()
-        log.debug(f"Descendants: {len(canal_root.descendants())}")
-        execution_time = time.time() - start_time
-        log.debug(f"Execution time in seconds: {execution_time}")
+        start_time = time.perf_counter_ns()
+        log.debug(f"Descendants: {canal_root.descendants().count()}")
+        execution_time = (time.perf_counter_ns() - start_time) / 1000
+        log.debug(f"Execution time in microseconds: {execution_time}")
 
         # Compute descendants of a leaf node
-        canal_leaf = NetworkNode.objects.get(name="200")
-        start_time = time.time()
-        log.debug(f"Ancestors: {len(canal_leaf.ancestors(max_depth=200))}")
-        execution_time = time.time() - start_time
-        log.debug(f"Execution time in seconds: {execution_time}")
+        start_time = time.perf_counter_ns()
+        log.debug(f"Ancestors: {canal_leaf.ancestors(max_depth=200).count()}")
+        execution_time = (time.perf_counter_ns() - start_time) / 1000
+        log.debug(f"Execution time in microseconds: {execution_time}")
 
         # Check if path exists from canal_root to canal_leaf
-        log.debug(f"Path Exists: {canal_root.path_exists(canal_leaf, max_depth=200)}")
-        self.assertTrue(canal_root.path_exists(canal_leaf, max_depth=200), True)
+        canal_path_exists = canal_root.path_exists(canal_leaf, max_depth=200)
+        log.debug(f"Path Exists: {canal_path_exists}")
+        self.assertTrue(canal_path_exists)
 
         # Find distance from root to leaf
-        log.debug(f"Distance: {canal_root.distance(canal_leaf, max_depth=200)}")
-        self.assertEqual(canal_root.distance(canal_leaf, max_depth=200), 60)
+        canal_distance = canal_root.distance(canal_leaf, max_depth=200)
+        log.debug(f"Distance: {canal_distance}")
+        self.assertEqual(canal_distance, 60)
 
         log.debug(f"Node count: {NetworkNode.objects.count()}")
         log.debug(f"Edge count: {NetworkEdge.objects.count()}")
@@ -518,38 +401,40 @@ class DagTestCase(TestCase):
 
         def create_multilinked_nodes(shared_edge_count):
             log.debug("Creating multiple links between a parent and child node")
-            child_node = NetworkNode.objects.create()
-            parent_node = NetworkNode.objects.create()
+            child_node, parent_node = NetworkNode.objects.bulk_create([NetworkNode(), NetworkNode()])
 
-            # Call this multiple times to create multiple edges between same parent/child
-            for _ in range(shared_edge_count):
-                child_node.add_parent(parent_node)
+            # Create multiple edges between same parent/child. These are duplicates by construction, so skip the
+            # per-edge checks in save() and insert them together (setting the name that save() would have set)
+            NetworkEdge.objects.bulk_create(
+                [
+                    NetworkEdge(parent=parent_node, child=child_node, name=f"{parent_node.name} {child_node.name}")
+                    for _ in range(shared_edge_count)
+                ]
+            )
 
             return child_node, parent_node
 
         def delete_parents():
             child_node, parent_node = create_multilinked_nodes(shared_edge_count)
 
-            # Refresh the related manager
-            child_node.refresh_from_db()
-
-            self.assertEqual(child_node.parents.count(), shared_edge_count)
-            log.debug(f"Initial parents count: {child_node.parents.count()}")
+            initial_count = child_node.parents.count()
+            log.debug(f"Initial parents count: {initial_count}")
+            self.assertEqual(initial_count, shared_edge_count)
             child_node.remove_parent(parent_node)
-            self.assertEqual(child_node.parents.count(), 0)
-            log.debug(f"Final parents count: {child_node.parents.count()}")
+            final_count = child_node.parents.count()
+            log.debug(f"Final parents count: {final_count}")
+            self.assertEqual(final_count, 0)
 
         def delete_children():
             child_node, parent_node = create_multilinked_nodes(shared_edge_count)
 
-            # Refresh the related manager
-            parent_node.refresh_from_db()
-
-            self.assertEqual(parent_node.children.count(), shared_edge_count)
-            log.debug(f"Initial children count: {parent_node.children.count()}")
+            initial_count = parent_node.children.count()
+            log.debug(f"Initial children count: {initial_count}")
+            self.assertEqual(initial_count, shared_edge_count)
             parent_node.remove_child(child_node)
-            self.assertEqual(parent_node.children.count(), 0)
-            log.debug(f"Final children count: {parent_node.children.count()}")
+            final_count = parent_node.children.count()
+            log.debug(f"Final children count: {final_count}")
+            self.assertEqual(final_count, 0)
 
         delete_parents()
         delete_children()
@@ -572,39 +457,37 @@ class DagTestCase(TestCase):
             n = 22  # Keep it an even number
 
             log.debug("Start creating nodes")
-            for i in range(2 * n):
-                NetworkNode(pk=i, name=str(i)).save()
+            # Let the database assign pks, since the class fixture nodes already occupy the low pk values
+            dag_nodes = NetworkNode.objects.bulk_create([NetworkNode(name=str(i)) for i in range(2 * n)])
             log.debug("Done creating nodes")
 
             # Create edges
             log.debug("Connect nodes")
+            edges = []
             for i in range(0, 2 * n - 2, 2):
-                p1 = NetworkNode.objects.get(pk=i)
-                p2 = NetworkNode.objects.get(pk=i + 1)
-                p3 = NetworkNode.objects.get(pk=i + 2)
-                p4 = NetworkNode.objects.get(pk=i + 3)
-
-                p1.add_child(p3)
-                p1.add_child(p4)
-                p2.add_child(p3)
-                p2.add_child(p4)
+                for parent in dag_nodes[i : i + 2]:
+                    for child in dag_nodes[i + 2 : i + 4]:
+                        edges.append(
+                            NetworkEdge(parent_id=parent.pk, child_id=child.pk, name=f"{parent.name} {child.name}")
+                        )
+            NetworkEdge.objects.bulk_create(edges)
 
             # Compute descendants of a root node
-            root_node = NetworkNode.objects.get(pk=0)
-            start_time = time.time()
-            log.debug(f"Descendants: {len(root_node.ancestors())}")
-            execution_time = time.time() - start_time
-            log.debug(f"Execution time in seconds: {execution_time}")
+            root_node = dag_nodes[0]
+            start_time = time.perf_counter_ns()
+            log.debug(f"Descendants: {root_node.ancestors().count()}")
+            execution_time = (time.perf_counter_ns() - start_time) / 1000
+            log.debug(f"Execution time in microseconds: {execution_time}")
 
             # Compute ancestors of a leaf node
-            leaf_node = NetworkNode.objects.get(pk=2 * n - 1)
-            start_time = time.time()
-            log.debug(f"Ancestors: {len(leaf_node.ancestors())}")
-            execution_time = time.time() - start_time
-            log.debug(f"Execution time in seconds: {execution_time}")
+            leaf_node = dag_nodes[2 * n - 1]
+            start_time = time.perf_counter_ns()
+            log.debug(f"Ancestors: {leaf_node.ancestors().count()}")
+            execution_time = (time.perf_counter_ns() - start_time) / 1000
+            log.debug(f"Execution time in microseconds: {execution_time}")
 
-            first = NetworkNode.objects.get(name="0")
-            last = NetworkNode.objects.get(name=str(2 * n - 1))
+            first = dag_nodes[0]
+            last = dag_nodes[2 * n - 1]
 
             path_exists = first.path_exists(last, max_depth=n)
             log.debug(f"Path exists: {path_exists}")
@@ -615,9 +498,9 @@ class DagTestCase(TestCase):
             log.debug(f"Edge count: {NetworkEdge.objects.count()}")
 
             # Connect the first-created node to the last-created node
-            NetworkNode.objects.get(pk=0).add_child(NetworkNode.objects.get(pk=2 * n - 1))
+            first.add_child(last)
 
-            middle = NetworkNode.objects.get(pk=n - 1)
+            middle = dag_nodes[n - 1]
             distance = first.distance(middle, max_depth=n)
             log.debug(f"Distance: {distance}")
             self.assertEqual(distance, n / 2 - 1)
@@ -630,3 +513,30 @@ class DagTestCase(TestCase):
             p.terminate()
             p.join()
             raise RuntimeError("Graph operations take too long!")
+
+    @unittest.skipUnless(HAS_NETWORKX, "networkx is not installed")
+    def test_05_networkx(self):
+        log = logging.getLogger("test_05")
+
+        nodes = {node.name: node for node in NetworkNode.objects.filter(name__in=["root", "a3", "b4", "c1"])}
+        root, a3, b4, c1 = nodes["root"], nodes["a3"], nodes["b4"], nodes["c1"]
+        root_a3 = root.add_child(a3)
+        a3.add_child(b4)
+        b4.add_child(c1)
+
+        # Test is we can properly export to a NetworkX graph
+        nx_out = nx_from_queryset(
+            c1.ancestors_and_self(),
+            graph_attributes_dict={"test": "test"},
+            node_attribute_fields_list=["id", "name"],
+            edge_attribute_fields_list=["id", "name"],
+        )
+        log.debug("Check attributes")
+        self.assertEqual(nx_out.graph, {"test": "test"})
+        self.assertEqual(nx_out.nodes[root.pk], {"id": root.pk, "name": "root"})
+        self.assertEqual(nx_out.edges[root.pk, a3.pk], {"id": root_a3.pk, "name": "root a3"})
+
+        log.debug("Empty queryset")
+        nx_empty = nx_from_queryset(NetworkNode.objects.none(), graph_attributes_dict={"test": "test"})
+        self.assertEqual(nx_empty.graph, {"test": "test"})
+        self.assertEqual(nx_empty.number_of_nodes(), 0)